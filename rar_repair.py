@@ -15,25 +15,849 @@ in esecuzione e spegnere il server direttamente dall'interfaccia.
 Autore: @peppeson
 """
 
-import http.server
-import socketserver
+import argparse
 import urllib.parse
 import subprocess
 import os
+import re
+import sys
 import json
 import threading
 import time
-import queue
+import signal
+import zlib
 from pathlib import Path
-from socketserver import ThreadingTCPServer
 
 PORT = 8080
 RAR_PATH = "/usr/local/bin/rar"
 ROOT_PATH = "/volume1"
+JOBS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rar_repair_jobs")
+MAX_RUNNING_JOBS = 2
+JOB_RETENTION = 7 * 24 * 3600
+FOLDER_STATS_INTERVAL = 6 * 3600
+FOLDER_STATS_MAX_AGE = 24 * 3600
+FOLDER_STATS_WORKERS = 4
+FOLDER_STATS_FIELDS = ("size", "complete", "incomplete", "repairable")
+# Un lavoro in attesa guadagna posizioni come se il suo costo (byte da leggere e scrivere)
+# calasse di JOB_AGING_RATE byte per ogni secondo di attesa: anche i set grandi partono.
+# Ogni livello di priorità vale JOB_PRIORITY_STEP byte di costo in meno, quindi anche un
+# lavoro a priorità bassa finisce per passare davanti ai nuovi lavori normali (dopo circa
+# mezz'ora di attesa in più).
+JOB_AGING_RATE = 50 * 1024 * 1024
+JOB_PRIORITY_STEP = 100 * 1024 * 1024 * 1024
+JOB_PRIORITY_LEVELS = (-1, 0, 1)
 
-streaming_sessions = {}
+job_manager = None
+folder_stats = None
 
-class RARRepairHandler(http.server.BaseHTTPRequestHandler):
+# Azioni eseguibili con `rar`: usate sia dal server web che dalla riga di comando.
+RAR_ACTIONS = {
+    "repair": {
+        "command": "rc",
+        "extensions": (".rev",),
+        "extension_label": ".rev",
+        "start": "🔧 Avvio riparazione RAR",
+        "success": "✅ Riparazione completata con successo!",
+        "failure": "❌ Riparazione fallita",
+    },
+    "verify": {
+        "command": "t",
+        "extensions": (".rar",) + tuple(f".r{i:02d}" for i in range(100)),
+        "extension_label": ".rar",
+        "start": "🔍 Avvio verifica RAR",
+        "success": "✅ Verifica completata con successo!",
+        "failure": "❌ Verifica fallita",
+    },
+}
+
+# Volumi: name.partN.rar, oppure name.rar, name.r00, ...; file di recupero: name.partN.rev,
+# oppure name.N.rev / name_N.rev per i set con lo schema .rar, .r00, ...
+RAR_SET_PATTERN = re.compile(
+    r"^(?P<name>.+?)(?:\.part(?P<part>\d+)|[._](?P<rev>\d+)(?=\.rev$))?\.(?P<ext>rar|rev|r\d\d)$",
+    re.IGNORECASE
+)
+
+def parse_rar_filename(filename):
+    """
+    Restituisce (nome del set, numero del volume, è_rev) oppure None se il file non fa parte di un set RAR.
+    I volumi sono numerati da 1 sia con lo schema .partN.rar che con quello .rar, .r00, .r01, ...
+    """
+    match = RAR_SET_PATTERN.match(filename)
+    if not match:
+        return None
+    ext = match.group('ext').lower()
+    if match.group('part'):
+        index = int(match.group('part'))
+    elif match.group('rev'):
+        index = int(match.group('rev'))
+    elif ext.startswith('r') and ext[1:].isdigit():
+        index = int(ext[1:]) + 2
+    else:
+        index = 1
+    return match.group('name'), index, ext == 'rev'
+
+def read_vint(data, pos):
+    value = shift = 0
+    while pos < len(data):
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+    return None, pos
+
+def rar_volume_continues(path):
+    """
+    Legge l'intestazione di fine archivio in coda al volume e restituisce True se dichiara che
+    esistono altri volumi dopo di questo, False se è l'ultimo, None se non è riconoscibile.
+    Gestisce sia il formato RAR5 che il formato RAR 2.9/4.x.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 32))
+            tail = f.read()
+    except OSError:
+        return None
+    
+    for start in range(len(tail) - 8, -1, -1):
+        # RAR5: CRC32, dimensione (vint), tipo 5 (vint), flag (vint), flag di fine archivio (vint).
+        if int.from_bytes(tail[start:start + 4], "little") != zlib.crc32(tail[start + 4:]):
+            continue
+        size, pos = read_vint(tail, start + 4)
+        if size != len(tail) - pos:
+            continue
+        header_type, pos = read_vint(tail, pos)
+        _, pos = read_vint(tail, pos)
+        end_flags, pos = read_vint(tail, pos)
+        if header_type == 5 and end_flags is not None and pos == len(tail):
+            return bool(end_flags & 0x0001)
+    
+    for start in range(len(tail) - 7, -1, -1):
+        # RAR 2.9/4.x: CRC16, tipo 0x7B, flag (2 byte), dimensione (2 byte) e campi opzionali.
+        if tail[start + 2] != 0x7B or int.from_bytes(tail[start + 5:start + 7], "little") != len(tail) - start:
+            continue
+        if int.from_bytes(tail[start:start + 2], "little") != zlib.crc32(tail[start + 2:]) & 0xFFFF:
+            continue
+        return bool(int.from_bytes(tail[start + 3:start + 5], "little") & 0x0001)
+    return None
+
+def rar_set_health(volumes, rev_count, continues=False):
+    """
+    Stima lo stato di un set a partire dai volumi presenti, una lista di (numero, dimensione).
+    Sono considerati mancanti i numeri saltati, i volumi (tranne l'ultimo) più piccoli degli
+    altri, cioè troncati, e un volume in più se l'ultimo presente dichiara che ne seguono
+    altri o è illeggibile (`continues`). Restituisce (stato, volumi mancanti) con stato "complete",
+    "repairable" (bastano i file .rev) o "incomplete".
+    """
+    if not volumes:
+        return "incomplete", None
+    indexes = {index for index, _ in volumes}
+    last = max(indexes)
+    volume_size = max(size for _, size in volumes)
+    missing = last - len(indexes)
+    missing += sum(1 for index, size in volumes if index != last and size < volume_size)
+    if continues:
+        missing += 1
+    if missing == 0:
+        return "complete", 0
+    return ("repairable" if rev_count >= missing else "incomplete"), missing
+
+def group_rar_sets(dirpath, files):
+    """Raggruppa i file di una cartella, una lista di (nome, dimensione), nei set RAR che contengono."""
+    sets = {}
+    for filename, size in files:
+        parsed = parse_rar_filename(filename)
+        if not parsed:
+            continue
+        name, index, is_rev = parsed
+        rar_set = sets.setdefault(name.lower(), {
+            "name": name, "path": dirpath, "volumes": [], "rev_files": [], "size": 0
+        })
+        rar_set["rev_files" if is_rev else "volumes"].append((index, os.path.join(dirpath, filename), size))
+        rar_set["size"] += size
+    result = []
+    for key in sorted(sets):
+        rar_set = sets[key]
+        volumes = sorted(rar_set["volumes"])
+        # Se l'ultimo volume di un set multi-volume non ha un blocco di fine archivio valido è
+        # troncato o ancora in download: conta come un volume mancante.
+        last_volume = rar_volume_continues(volumes[-1][1]) if volumes else False
+        continues = last_volume is True or (last_volume is None and len(volumes) > 1)
+        rar_set["status"], rar_set["missing"] = rar_set_health(
+            [(index, size) for index, _, size in volumes], len(rar_set["rev_files"]), continues
+        )
+        # I volumi di recupero .rev hanno la stessa dimensione dei volumi di dati.
+        rar_set["volume_size"] = max(size for _, _, size in volumes + rar_set["rev_files"])
+        rar_set["volumes"] = [path for _, path, _ in volumes]
+        rar_set["rev_files"] = [path for _, path, _ in sorted(rar_set["rev_files"])]
+        result.append(rar_set)
+    return result
+
+def find_rar_sets(root):
+    """Raggruppa i volumi .rar e i file .rev trovati sotto `root` in set, uno per cartella e nome base."""
+    result = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('@'))
+        files = []
+        for filename in filenames:
+            try:
+                files.append((filename, os.path.getsize(os.path.join(dirpath, filename))))
+            except OSError:
+                continue
+        result.extend(group_rar_sets(dirpath, files))
+    return result
+
+def list_files(dirpath):
+    """Restituisce i file di una cartella come lista di (nome, dimensione)."""
+    files = []
+    try:
+        with os.scandir(dirpath) as it:
+            for dir_entry in it:
+                try:
+                    if dir_entry.is_file():
+                        files.append((dir_entry.name, dir_entry.stat().st_size))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files
+
+def rar_set_cost(action, rar_set):
+    """
+    Stima il costo di un'azione su un set in byte da leggere e da scrivere: per "verify" i
+    volumi, per "repair" anche i file .rev e i volumi mancanti da ricostruire.
+    """
+    if action == "verify":
+        return rar_set["volume_size"] * len(rar_set["volumes"])
+    return rar_set["size"] + (rar_set["missing"] or 0) * rar_set["volume_size"]
+
+def estimate_rar_cost(action, target, files=None):
+    """
+    Come rar_set_cost(), per il set a cui appartiene `target`. `files` è l'elenco dei file
+    della cartella (vedi list_files), se già disponibile. Restituisce 0 se il set non è riconoscibile.
+    """
+    parsed = parse_rar_filename(os.path.basename(target))
+    if not parsed:
+        return 0
+    dirpath = os.path.dirname(target)
+    if files is None:
+        files = list_files(dirpath)
+    name = parsed[0].lower()
+    files = [(filename, size) for filename, size in files
+             if (parse_rar_filename(filename) or ("",))[0].lower() == name]
+    for rar_set in group_rar_sets(dirpath, files):
+        return rar_set_cost(action, rar_set)
+    return 0
+
+class FolderStatsWalker:
+    """
+    Calcola in background, per ogni cartella sotto `root`, la dimensione totale e il numero di
+    set RAR completi, incompleti e riparabili (sottocartelle comprese), così /browse risponde
+    leggendo solo la cache. Una passata completa scansiona le cartelle un livello alla volta in
+    parallelo e poi somma i risultati dal basso verso l'alto; viene eseguita all'avvio e poi
+    ogni `interval` secondi (0 = mai), e rilegge solo le cartelle con mtime cambiato o con una
+    scansione più vecchia di FOLDER_STATS_MAX_AGE (il mtime di una cartella non cambia quando
+    cresce un file già esistente). Tra una passata e l'altra refresh(path) rilegge solo la
+    cartella indicata e ricalcola i totali delle cartelle che la contengono, così i dischi
+    possono andare in standby.
+    """
+
+    def __init__(self, root=ROOT_PATH, workers=FOLDER_STATS_WORKERS, interval=FOLDER_STATS_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.workers = workers
+        self.interval = interval
+        self.entries = {}
+        self.totals = {}
+        self.requested = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def refresh(self, path):
+        with self.lock:
+            self.requested.add(os.path.abspath(path))
+        self.wakeup.set()
+
+    def get(self, path):
+        return self.totals.get(os.path.abspath(path))
+
+    def is_stale(self, path):
+        entry = self.entries.get(os.path.abspath(path))
+        try:
+            return entry is None or entry['mtime'] != os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+
+    def run(self):
+        # La passata completa ha una scadenza fissa: le richieste di refresh() non la rimandano.
+        next_full_walk = time.monotonic()
+        while True:
+            try:
+                if next_full_walk is not None and time.monotonic() >= next_full_walk:
+                    next_full_walk = time.monotonic() + self.interval if self.interval else None
+                    self.walk(self.root)
+                with self.lock:
+                    requested, self.requested = self.requested, set()
+                for path in sorted(requested):
+                    self.update_folder(path)
+            except Exception as e:
+                print(f"⚠️  Errore durante la scansione delle cartelle: {e}")
+            timeout = None if next_full_walk is None else max(0, next_full_walk - time.monotonic())
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def walk(self, start):
+        from concurrent.futures import ThreadPoolExecutor
+        levels = []
+        scanned = {}
+        level = [start]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while level:
+                levels.append(level)
+                next_level = []
+                for path, entry in zip(level, executor.map(self.scan_directory, level)):
+                    if entry is not None:
+                        scanned[path] = entry
+                        next_level.extend(entry['subdirs'])
+                level = next_level
+        
+        for path in list(self.entries):
+            if (path == start or path.startswith(start + os.sep)) and path not in scanned:
+                self.entries.pop(path, None)
+                self.totals.pop(path, None)
+        
+        for level in reversed(levels):
+            for path in level:
+                if path in scanned:
+                    self.sum_totals(path)
+
+    def update_folder(self, path):
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return
+        # Una cartella nuova viene letta a partire dalla cartella già nota più vicina.
+        while path != self.root and path not in self.entries:
+            path = os.path.dirname(path)
+        old_entry = self.entries.get(path)
+        entry = self.scan_directory(path, force=True)
+        if entry is None:
+            self.forget(path)
+            if path != self.root:
+                self.update_folder(os.path.dirname(path))
+            return
+        
+        for subdir in set(old_entry['subdirs'] if old_entry else []) - set(entry['subdirs']):
+            self.forget(subdir)
+        for subdir in entry['subdirs']:
+            if subdir not in self.entries:
+                self.walk(subdir)
+        
+        while True:
+            self.sum_totals(path)
+            if path == self.root:
+                break
+            path = os.path.dirname(path)
+
+    def forget(self, path):
+        for cached in list(self.entries):
+            if cached == path or cached.startswith(path + os.sep):
+                self.entries.pop(cached, None)
+                self.totals.pop(cached, None)
+
+    def sum_totals(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            return
+        totals = {field: entry[field] for field in FOLDER_STATS_FIELDS}
+        for subdir in entry['subdirs']:
+            child = self.totals.get(subdir)
+            if child:
+                for field in FOLDER_STATS_FIELDS:
+                    totals[field] += child[field]
+        self.totals[path] = totals
+
+    def scan_directory(self, path, force=False):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        entry = self.entries.get(path)
+        if not force and entry and entry['mtime'] == mtime and time.time() - entry['scanned'] < FOLDER_STATS_MAX_AGE:
+            return entry
+        
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(path) as it:
+                for dir_entry in it:
+                    if dir_entry.name.startswith('@'):
+                        continue
+                    try:
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            subdirs.append(dir_entry.path)
+                        elif dir_entry.is_file():
+                            files.append((dir_entry.name, dir_entry.stat().st_size))
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        
+        entry = {"mtime": mtime, "scanned": time.time(), "subdirs": sorted(subdirs),
+                 "size": sum(size for _, size in files), "complete": 0, "incomplete": 0, "repairable": 0}
+        for rar_set in group_rar_sets(path, files):
+            entry[rar_set["status"]] += 1
+        self.entries[path] = entry
+        return entry
+
+def check_rar_target(action, target):
+    """Restituisce un messaggio di errore se `target` non può essere elaborato con l'azione indicata, altrimenti None."""
+    spec = RAR_ACTIONS[action]
+    if not os.path.exists(target):
+        return f"❌ Errore: File non trovato: {target}\n"
+    if not target.lower().endswith(spec['extensions']):
+        return f"❌ Errore: Il file deve avere estensione {spec['extension_label']}\n"
+    if not os.path.exists(RAR_PATH):
+        return f"❌ Errore: RAR non trovato in {RAR_PATH}\n"
+    return None
+
+def rar_start_lines(action, target, cmd, work_dir):
+    return [
+        f"{RAR_ACTIONS[action]['start']}\n",
+        f"📁 File: {target}\n",
+        f"⏰ Inizio: {time.strftime('%H:%M:%S')}\n",
+        "-" * 50 + "\n",
+        f"$ {' '.join(cmd)}\n",
+        f"📂 Directory: {work_dir}\n\n",
+    ]
+
+def rar_end_lines(action, return_code):
+    spec = RAR_ACTIONS[action]
+    lines = ["\n" + "=" * 50 + "\n"]
+    if return_code == 0:
+        lines.append(f"{spec['success']}\n")
+    elif return_code is None or return_code == -9 or return_code == -15:
+        lines.append("✅ Processo terminato.\n")
+    else:
+        lines.append(f"{spec['failure']} (codice: {return_code})\n")
+    lines.append(f"⏰ Fine: {time.strftime('%H:%M:%S')}\n")
+    return lines
+
+# Con un file .rc `rar` viene avviato tramite `sh` in una nuova sessione, così sopravvive a chi
+# lo ha lanciato. Al termine `sh` scrive il codice di uscita nel file indicato come $0 (che
+# compare anche nella riga di comando del processo e permette di riconoscerlo in seguito).
+JOB_WRAPPER = '"$@"; echo $? > "$0.tmp" && mv "$0.tmp" "$0"'
+
+def rar_command(action, target):
+    return [RAR_PATH, RAR_ACTIONS[action]['command'], target], os.path.dirname(target)
+
+def spawn_rar(cmd, work_dir, stdout, rc_path=None):
+    """
+    Avvia `cmd` in `work_dir` con l'output (stdout e stderr) su `stdout`. Se viene indicato
+    `rc_path` il processo è indipendente dal chiamante (vedi JOB_WRAPPER).
+    """
+    if rc_path:
+        cmd = ["/bin/sh", "-c", JOB_WRAPPER, rc_path] + cmd
+    return subprocess.Popen(
+        cmd,
+        cwd=work_dir,
+        stdin=subprocess.DEVNULL,
+        stdout=stdout,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        bufsize=1,
+        start_new_session=bool(rc_path)
+    )
+
+def rar_set_key(path):
+    """Identifica il set RAR a cui appartiene un file: (cartella, nome del set) oppure il percorso stesso."""
+    path = os.path.abspath(path)
+    parsed = parse_rar_filename(os.path.basename(path))
+    return (os.path.dirname(path), parsed[0].lower()) if parsed else path
+
+def running_rar_sets():
+    """Restituisce i set su cui sta lavorando un processo `rar`, chiunque lo abbia avviato."""
+    sets = set()
+    if not os.path.isdir("/proc"):
+        return sets
+    rar_path = os.fsencode(RAR_PATH)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                args = f.read().rstrip(b"\0").split(b"\0")
+        except OSError:
+            continue
+        if rar_path in args[:-1]:
+            sets.add(rar_set_key(os.fsdecode(args[-1])))
+    return sets
+
+def run_rar_action(action, target, output_queue):
+    """
+    Esegue `rar` per l'azione indicata ("repair" o "verify") scrivendo l'output riga per riga
+    su `output_queue` (qualsiasi oggetto con un metodo `put`), chiuso sempre da "__DONE__".
+    Restituisce il codice di uscita di `rar`, oppure None in caso di errore.
+    """
+    try:
+        error = check_rar_target(action, target)
+        if error:
+            output_queue.put(error)
+            return None
+        
+        cmd, work_dir = rar_command(action, target)
+        for line in rar_start_lines(action, target, cmd, work_dir):
+            output_queue.put(line)
+        
+        process = spawn_rar(cmd, work_dir, subprocess.PIPE)
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                break
+            output_queue.put(line)
+        
+        return_code = process.wait()
+        for line in rar_end_lines(action, return_code):
+            output_queue.put(line)
+        return return_code
+        
+    except Exception as e:
+        output_queue.put(f"\n❌ Errore imprevisto: {str(e)}\n")
+        return None
+    finally:
+        output_queue.put("__DONE__")
+
+JOB_ACTIVE_STATES = ("starting", "running")
+JOB_FINISHED_STATES = ("done", "failed", "cancelled")
+
+def load_jobs(jobs_path):
+    jobs = []
+    try:
+        entries = os.listdir(jobs_path)
+    except OSError:
+        return jobs
+    for entry in entries:
+        if not entry.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(jobs_path, entry), encoding="utf-8") as f:
+                jobs.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return jobs
+
+class JobManager:
+    """
+    Coda dei lavori del server web, salvata su disco in `jobs_path`: per ogni lavoro un file
+    <id>.json con lo stato, <id>.log con l'output e <id>.rc con il codice di uscita di `rar`.
+    I processi `rar` sono indipendenti dal server: al riavvio vengono ripresi se ancora in
+    esecuzione, mentre i lavori non terminati vengono rimessi in coda.
+    """
+
+    def __init__(self, jobs_path=JOBS_PATH, max_running=MAX_RUNNING_JOBS):
+        # Percorso assoluto: `sh` gira nella cartella del download e scrive lì il file .rc.
+        self.jobs_path = os.path.abspath(jobs_path)
+        self.max_running = max_running
+        self.jobs = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.lock_file = None
+
+    def open(self):
+        import fcntl
+        os.makedirs(self.jobs_path, exist_ok=True)
+        self.lock_file = open(os.path.join(self.jobs_path, ".lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        self.recover()
+        thread = threading.Thread(target=self.dispatch_loop)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def job_file(self, job_id, ext):
+        return os.path.join(self.jobs_path, f"{job_id}.{ext}")
+
+    def save(self, job):
+        path = self.job_file(job['id'], "json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def log(self, job, *lines):
+        with open(self.job_file(job['id'], "log"), "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        """Restituisce tutti i lavori; quelli in coda hanno anche `position`, l'ordine in cui partiranno."""
+        with self.lock:
+            positions = {job_id: index + 1 for index, job_id in enumerate(self.queue_order())}
+            jobs = [dict(job, position=positions.get(job['id'])) for job in self.jobs.values()]
+        return sorted(jobs, key=lambda job: job['created'])
+
+    def submit(self, action, target, priority=0):
+        """
+        Mette in coda un lavoro e restituisce (lavoro, creato). Se per lo stesso set c'è già un
+        lavoro in coda o in esecuzione viene restituito quello, così `rar` non elabora due
+        volte lo stesso set contemporaneamente.
+        """
+        import uuid
+        target = os.path.abspath(target)
+        with self.lock:
+            existing = self.find_active_job(target)
+        if existing:
+            return existing, False
+        job = {
+            "id": str(uuid.uuid4()),
+            "action": action,
+            "target": target,
+            "status": "queued",
+            "pid": None,
+            "returncode": None,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "priority": max(min(priority, max(JOB_PRIORITY_LEVELS)), min(JOB_PRIORITY_LEVELS)),
+            "cost": estimate_rar_cost(action, target),
+        }
+        with self.lock:
+            existing = self.find_active_job(target)
+            if existing:
+                return existing, False
+            self.log(job, f"⏳ Lavoro in coda: partirà appena si libera un posto (massimo {self.max_running} in contemporanea).\n\n")
+            self.save(job)
+            self.jobs[job['id']] = job
+            self.pending.append(job['id'])
+            self.wakeup.notify()
+        return job, True
+
+    def find_active_job(self, target):
+        key = rar_set_key(target)
+        for job in self.jobs.values():
+            if job['status'] not in JOB_FINISHED_STATES and rar_set_key(job['target']) == key:
+                return job
+        return None
+
+    def set_priority(self, job_id, priority):
+        if priority not in JOB_PRIORITY_LEVELS:
+            return False, "Priorità non valida"
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return False, "Sessione non valida o scaduta."
+            if job['status'] != "queued":
+                return False, "Il lavoro non è più in coda."
+            job['priority'] = priority
+            self.save(job)
+        return True, None
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return False, "Sessione non valida o scaduta."
+            if job['status'] == "queued":
+                self.pending.remove(job_id)
+                self.log(job, "🛑 Riparazione annullata dall'utente.\n")
+                self.finish(job, "cancelled", None)
+                return True, None
+            if job['status'] != "running":
+                return False, "Processo non in esecuzione o già terminato."
+            job['cancel_requested'] = True
+            self.save(job)
+        try:
+            os.killpg(job['pid'], signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        except Exception as e:
+            return False, str(e)
+        self.log(job, "\n\n🛑 Riparazione annullata dall'utente.\n")
+        return True, None
+
+    def recover(self):
+        for job in sorted(load_jobs(self.jobs_path), key=lambda job: job['created']):
+            if job['status'] in JOB_FINISHED_STATES:
+                if time.time() - (job['finished'] or job['created']) > JOB_RETENTION:
+                    for ext in ("json", "log", "rc"):
+                        try:
+                            os.remove(self.job_file(job['id'], ext))
+                        except OSError:
+                            pass
+                    continue
+                self.jobs[job['id']] = job
+            elif job['status'] in JOB_ACTIVE_STATES:
+                self.jobs[job['id']] = job
+                pid = self.find_process(job)
+                if pid:
+                    job['pid'] = pid
+                    job['status'] = "running"
+                    self.save(job)
+                    self.log(job, f"\n♻️ Processo ripreso dopo il riavvio del server (PID {pid})\n")
+                    self.watch(job)
+                elif os.path.exists(self.job_file(job['id'], "rc")):
+                    self.complete(job)
+                else:
+                    job['status'] = "queued"
+                    job['pid'] = None
+                    job['cost'] = estimate_rar_cost(job['action'], job['target'])
+                    self.save(job)
+                    self.log(job, "\n♻️ Processo interrotto dal riavvio: lavoro rimesso in coda\n\n")
+                    self.pending.append(job['id'])
+            else:
+                job['cost'] = estimate_rar_cost(job['action'], job['target'])
+                self.save(job)
+                self.jobs[job['id']] = job
+                self.pending.append(job['id'])
+
+    def is_job_process(self, job, pid):
+        marker = self.job_file(job['id'], "rc").encode()
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                return marker in f.read().split(b"\0")
+        except FileNotFoundError:
+            if os.path.isdir("/proc"):
+                return False
+        except OSError:
+            return False
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
+
+    def find_process(self, job):
+        # Il PID salvato è solo un suggerimento: se non corrisponde (PID riutilizzato, oppure
+        # server fermato prima di salvarlo) il processo viene cercato in /proc.
+        if job.get('pid') and self.is_job_process(job, job['pid']):
+            return job['pid']
+        if not os.path.isdir("/proc"):
+            return None
+        for entry in os.listdir("/proc"):
+            if entry.isdigit() and self.is_job_process(job, int(entry)):
+                return int(entry)
+        return None
+
+    def dispatch_loop(self):
+        while True:
+            with self.lock:
+                while not self.pending or self.running_count() >= self.max_running:
+                    self.wakeup.wait()
+                job_id = self.next_job_id()
+                self.pending.remove(job_id)
+                job = self.jobs[job_id]
+                job['status'] = "starting"
+                self.save(job)
+            try:
+                self.start(job)
+            except Exception as e:
+                self.log(job, f"\n❌ Errore imprevisto: {str(e)}\n")
+                with self.lock:
+                    self.finish(job, "failed", None)
+
+    def job_rank(self, job, now):
+        # Costo stimato, ridotto dall'attesa (JOB_AGING_RATE) e dalla priorità (JOB_PRIORITY_STEP).
+        waited = now - job['created']
+        cost = job.get('cost', 0) - waited * JOB_AGING_RATE - job.get('priority', 0) * JOB_PRIORITY_STEP
+        return (cost, job['created'])
+
+    def queue_order(self):
+        now = time.time()
+        return sorted(self.pending, key=lambda job_id: self.job_rank(self.jobs[job_id], now))
+
+    def next_job_id(self):
+        now = time.time()
+        return min(self.pending, key=lambda job_id: self.job_rank(self.jobs[job_id], now))
+
+    def running_count(self):
+        return sum(1 for job in self.jobs.values() if job['status'] in JOB_ACTIVE_STATES)
+
+    def start(self, job):
+        error = check_rar_target(job['action'], job['target'])
+        if error:
+            self.log(job, error)
+            with self.lock:
+                self.finish(job, "failed", None)
+            return
+        
+        if rar_set_key(job['target']) in running_rar_sets():
+            self.log(job, "❌ Errore: `rar` sta già elaborando questo set (avviato dalla riga di comando?)\n")
+            with self.lock:
+                self.finish(job, "failed", None)
+            return
+        
+        cmd, work_dir = rar_command(job['action'], job['target'])
+        rc_path = self.job_file(job['id'], "rc")
+        if os.path.exists(rc_path):
+            os.remove(rc_path)
+        self.log(job, *rar_start_lines(job['action'], job['target'], cmd, work_dir))
+        
+        with open(self.job_file(job['id'], "log"), "ab") as log_file:
+            process = spawn_rar(cmd, work_dir, log_file, rc_path)
+        with self.lock:
+            job['pid'] = process.pid
+            job['status'] = "running"
+            job['started'] = time.time()
+            self.save(job)
+        self.watch(job, process)
+
+    def watch(self, job, process=None):
+        def wait_for_exit():
+            while True:
+                if process is not None:
+                    if process.poll() is not None:
+                        break
+                elif not self.is_job_process(job, job['pid']):
+                    break
+                time.sleep(1)
+            self.complete(job)
+
+        thread = threading.Thread(target=wait_for_exit)
+        thread.daemon = True
+        thread.start()
+
+    def complete(self, job):
+        try:
+            with open(self.job_file(job['id'], "rc")) as f:
+                return_code = int(f.read().strip())
+        except (OSError, ValueError):
+            return_code = None
+        if job.get('cancel_requested') or return_code is None:
+            status = "cancelled"
+        else:
+            status = "done" if return_code == 0 else "failed"
+        self.log(job, *rar_end_lines(job['action'], None if status == "cancelled" else return_code))
+        if folder_stats:
+            folder_stats.refresh(os.path.dirname(job['target']))
+        with self.lock:
+            self.finish(job, status, return_code)
+
+    def finish(self, job, status, return_code):
+        job['status'] = status
+        job['returncode'] = return_code
+        job['finished'] = time.time()
+        self.save(job)
+        self.wakeup.notify()
+
+class RARRepairRoutes:
+    """
+    Logica HTTP del server web. La classe handler vera e propria (che eredita anche da
+    http.server.BaseHTTPRequestHandler) viene creata in serve(), così la riga di comando
+    non deve importare i moduli del server.
+    """
     
     def do_GET(self):
         if self.path == '/':
@@ -49,6 +873,8 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
             self.handle_browse_request()
         elif self.path.startswith('/stream/'):
             self.handle_stream_request()
+        elif self.path == '/jobs':
+            self.send_json_response({"success": True, "jobs": job_manager.list_jobs()})
         else:
             self.send_error(404)
     
@@ -66,30 +892,42 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
             rev_file = params.get('rev_file', [''])[0].strip()
             if not rev_file:
                 self.send_json_response({"success": False, "error": "File non specificato"}); return
-            session_id = self.start_repair_stream(rev_file)
-            self.send_json_response({"success": True, "session_id": session_id})
+            priority = self.parse_priority(params.get('priority', ['0'])[0])
+            if priority is None:
+                self.send_json_response({"success": False, "error": "Priorità non valida"}); return
+            job, created = job_manager.submit("repair", rev_file, priority)
+            self.send_json_response({"success": True, "session_id": job['id'], "created": created})
 
-        elif self.path == '/cancel':
+        elif self.path == '/priority':
             session_id = params.get('session_id', [''])[0].strip()
-            if not session_id or session_id not in streaming_sessions:
-                self.send_json_response({"success": False, "error": "Sessione non valida o scaduta."}); return
-
-            session = streaming_sessions.get(session_id)
-            process_to_kill = session.get('process')
+            priority = self.parse_priority(params.get('priority', [''])[0])
+            if priority is None:
+                self.send_json_response({"success": False, "error": "Priorità non valida"}); return
+            success, error = job_manager.set_priority(session_id, priority)
+            if success:
+                self.send_json_response({"success": True, "message": "Priorità aggiornata"})
+            else:
+                self.send_json_response({"success": False, "error": error})
 
-            if process_to_kill and process_to_kill.poll() is None:
-                try:
-                    process_to_kill.terminate()
-                    session['queue'].put("\n\n🛑 Riparazione annullata dall'utente.\n")
-                    self.send_json_response({"success": True, "message": "Processo annullato"})
-                except Exception as e:
-                    self.send_json_response({"success": False, "error": str(e)})
+        elif self.path == '/cancel':
+            session_id = params.get('session_id', [''])[0].strip()
+            success, error = job_manager.cancel(session_id)
+            if success:
+                self.send_json_response({"success": True, "message": "Processo annullato"})
             else:
-                self.send_json_response({"success": False, "error": "Processo non in esecuzione o già terminato."})
+                self.send_json_response({"success": False, "error": error})
         
         else:
             self.send_error(404)
 
+    def parse_priority(self, value):
+        # Solo i livelli offerti dall'interfaccia: ognuno vale JOB_PRIORITY_STEP byte di costo.
+        try:
+            priority = int(value)
+        except ValueError:
+            return None
+        return priority if priority in JOB_PRIORITY_LEVELS else None
+
     def handle_browse_request(self):
         query = urllib.parse.urlparse(self.path).query
         params = urllib.parse.parse_qs(query)
@@ -130,11 +968,15 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
                 
                 try:
                     if os.path.isdir(entry_path):
-                        items.append({
+                        item = {
                             "name": entry,
                             "type": "directory",
                             "path": entry_path
-                        })
+                        }
+                        stats = folder_stats.get(entry_path) if folder_stats else None
+                        if stats:
+                            item.update(stats)
+                        items.append(item)
                     elif os.path.isfile(entry_path):
                         show_file = False
                         file_ext = entry.lower()
@@ -156,6 +998,9 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
                 except (PermissionError, OSError):
                     continue
             
+            if folder_stats and folder_stats.is_stale(path):
+                folder_stats.refresh(path)
+            
             breadcrumb = self.create_breadcrumb(path)
             
             return {
@@ -183,90 +1028,19 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
         
         return breadcrumb
     
-    def start_repair_stream(self, rev_file):
-        import uuid
-        session_id = str(uuid.uuid4())
-        
-        output_queue = queue.Queue()
-        streaming_sessions[session_id] = {"queue": output_queue, "process": None}
-        
-        thread = threading.Thread(
-            target=self.run_repair_with_streaming,
-            args=(rev_file, output_queue, session_id)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        return session_id
-    
-    def run_repair_with_streaming(self, rev_file, output_queue, session_id):
-        process = None
-        try:
-            if not os.path.exists(rev_file):
-                output_queue.put(f"❌ Errore: File non trovato: {rev_file}\n")
-                output_queue.put("__DONE__")
-                return
-            
-            if not rev_file.lower().endswith('.rev'):
-                output_queue.put(f"❌ Errore: Il file deve avere estensione .rev\n")
-                output_queue.put("__DONE__")
-                return
-            
-            if not os.path.exists(RAR_PATH):
-                output_queue.put(f"❌ Errore: RAR non trovato in {RAR_PATH}\n")
-                output_queue.put("__DONE__")
-                return
-            
-            output_queue.put(f"🔧 Avvio riparazione RAR\n")
-            output_queue.put(f"📁 File: {rev_file}\n")
-            output_queue.put(f"⏰ Inizio: {time.strftime('%H:%M:%S')}\n")
-            output_queue.put("-" * 50 + "\n")
-            
-            cmd = [RAR_PATH, "rc", rev_file]
-            work_dir = os.path.dirname(rev_file)
-            
-            output_queue.put(f"$ {' '.join(cmd)}\n")
-            output_queue.put(f"📂 Directory: {work_dir}\n\n")
-            
-            process = subprocess.Popen(
-                cmd,
-                cwd=work_dir,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-            streaming_sessions[session_id]['process'] = process
-            
-            while True:
-                line = process.stdout.readline()
-                if not line:
-                    break
-                output_queue.put(line)
-            
-            return_code = process.wait()
-            
-            output_queue.put("\n" + "=" * 50 + "\n")
-            if return_code == 0:
-                output_queue.put("✅ Riparazione completata con successo!\n")
-            elif return_code == -9 or return_code == -15:
-                 output_queue.put("✅ Processo terminato.\n")
-            else:
-                output_queue.put(f"❌ Riparazione fallita (codice: {return_code})\n")
-            
-            output_queue.put(f"⏰ Fine: {time.strftime('%H:%M:%S')}\n")
-            
-        except Exception as e:
-            output_queue.put(f"\n❌ Errore imprevisto: {str(e)}\n")
-        finally:
-            output_queue.put("__DONE__")
-            threading.Timer(300, lambda: streaming_sessions.pop(session_id, None)).start()
-
     def handle_stream_request(self):
         session_id = self.path.split('/')[-1]
         
-        session_data = streaming_sessions.get(session_id)
-        if not session_data:
+        job = job_manager.get(session_id)
+        if not job:
+            self.send_error(404)
+            return
+        
+        # Il log si apre prima di inviare le intestazioni: se manca (cartella lavori pulita a
+        # mano) si risponde 404 invece di chiudere uno stream 200 già avviato.
+        try:
+            log_file = open(job_manager.job_file(session_id, "log"), "rb")
+        except OSError:
             self.send_error(404)
             return
         
@@ -277,25 +1051,30 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
         
-        output_queue = session_data['queue']
-        
+        # L'output viene letto dal file di log del lavoro: chi si ricollega (anche dopo un
+        # riavvio del server) riceve l'intero output dall'inizio.
+        idle_since = time.monotonic()
         try:
-            while True:
-                try:
-                    data = output_queue.get(timeout=1)
-                    
-                    if data == "__DONE__":
+            with log_file:
+                while True:
+                    finished = job['status'] in JOB_FINISHED_STATES
+                    line = log_file.readline()
+                    if line and (line.endswith(b"\n") or finished):
+                        escaped_data = json.dumps(line.decode("utf-8", errors="replace"))
+                        self.wfile.write(f"data: {escaped_data}\n\n".encode())
+                        self.wfile.flush()
+                        idle_since = time.monotonic()
+                        continue
+                    if line:
+                        log_file.seek(-len(line), os.SEEK_CUR)
+                    if finished:
                         self.wfile.write(f"event: done\ndata: \n\n".encode())
                         break
-                    
-                    import json
-                    escaped_data = json.dumps(data)
-                    self.wfile.write(f"data: {escaped_data}\n\n".encode())
-                    self.wfile.flush()
-                    
-                except queue.Empty:
-                    self.wfile.write(f"event: heartbeat\ndata: \n\n".encode())
-                    self.wfile.flush()
+                    if time.monotonic() - idle_since >= 1:
+                        self.wfile.write(f"event: heartbeat\ndata: \n\n".encode())
+                        self.wfile.flush()
+                        idle_since = time.monotonic()
+                    time.sleep(0.2)
                     
         except (ConnectionResetError, BrokenPipeError):
             pass
@@ -377,6 +1156,7 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
         .file-icon { width: 20px; margin-right: 10px; text-align: center; }
         .file-name { flex: 1; font-weight: 500; }
         .file-size { color: #666; font-size: 12px; margin-left: 10px; }
+        .file-health { font-size: 12px; margin-left: 10px; white-space: nowrap; }
         
         .form-group { margin-bottom: 20px; }
         label { display: block; margin-bottom: 5px; font-weight: bold; color: #555; }
@@ -401,6 +1181,8 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
         button:hover { background-color: #0056b3; }
         button:disabled { background-color: #ccc; cursor: not-allowed; }
         
+        #priority { padding: 11px; border: 2px solid #ddd; border-radius: 5px; font-size: 14px; }
+        
         #cancelBtn {
             background-color: #dc3545;
             display: none;
@@ -412,6 +1194,18 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
         .terminal { margin-top: 20px; background: #1e1e1e; color: #00ff00; padding: 15px; border-radius: 5px; font-family: 'Courier New', monospace; font-size: 13px; line-height: 1.4; max-height: 400px; overflow-y: auto; white-space: pre-wrap; display: none; }
         .terminal.active { display: block; }
         
+        .jobs-section { margin-top: 20px; border: 2px solid #e0e0e0; border-radius: 8px; overflow: hidden; }
+        .jobs-header { background: #f8f9fa; padding: 10px 15px; border-bottom: 1px solid #e0e0e0; font-weight: bold; color: #555; }
+        .job-list { max-height: 300px; overflow-y: auto; }
+        .job-item { display: flex; align-items: center; gap: 10px; padding: 8px 15px; border-bottom: 1px solid #f0f0f0; }
+        .job-item.selected { background-color: #e3f2fd; }
+        .job-name { flex: 1; font-weight: 500; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; }
+        .job-status { color: #666; font-size: 12px; white-space: nowrap; }
+        .job-btn { padding: 4px 10px; font-size: 12px; min-width: 0; }
+        .job-priority { padding: 3px; border: 1px solid #ccc; border-radius: 4px; font-size: 12px; }
+        .job-btn.job-cancel { background-color: #dc3545; }
+        .job-btn.job-cancel:hover { background-color: #c82333; }
+        
         .info { background-color: #d1ecf1; border: 1px solid #bee5eb; color: #0c5460; margin-bottom: 20px; padding: 15px; border-radius: 5px; }
         
         .loading { display: inline-block; width: 20px; height: 20px; border: 3px solid #f3f3f3; border-top: 3px solid #007bff; border-radius: 50%; animation: spin 1s linear infinite; margin-right: 10px; }
@@ -434,8 +1228,8 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
             <strong>Come usare:</strong><br>
             1. Naviga nelle cartelle e seleziona un file .rev<br>
             2. Oppure inserisci manualmente il percorso<br>
-            3. Clicca "Ripara Archivio" e monitora il progresso<br>
-            4. Se necessario, puoi annullare la riparazione in corso
+            3. Clicca "Ripara Archivio": il lavoro entra nella coda, puoi aggiungerne altri<br>
+            4. Dalla coda lavori puoi vedere l'output di ogni lavoro o annullarlo
         </div>
         
         <div class="browser-section">
@@ -465,11 +1259,21 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
             
             <div class="action-buttons">
                 <button type="submit" id="repairBtn">Ripara Archivio</button>
+                <select id="priority" title="Priorità nella coda">
+                    <option value="0" selected>Priorità normale</option>
+                    <option value="1">Priorità alta</option>
+                    <option value="-1">Priorità bassa</option>
+                </select>
                 <button type="button" id="cancelBtn">Annulla Riparazione</button>
             </div>
         </form>
         
         <div id="terminal" class="terminal"></div>
+        
+        <div class="jobs-section">
+            <div class="jobs-header">Coda lavori</div>
+            <div class="job-list" id="jobList"></div>
+        </div>
     </div>
 
     <script>
@@ -477,10 +1281,18 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
         let currentFilter = 'all';
         let selectedFile = '';
         let currentSessionId = null;
+        let currentEventSource = null;
+        let jobs = [];
 
         document.addEventListener('DOMContentLoaded', function() {
             setupEventListeners();
             setTimeout(() => loadDirectory(currentPath), 100);
+            // Alla riapertura della pagina mostra l'output del lavoro in esecuzione più recente.
+            refreshJobs().then(() => {
+                const running = jobs.filter(job => job.status === 'running').sort((a, b) => b.started - a.started);
+                if (running.length && !currentSessionId) viewJob(running[0].id);
+            });
+            setInterval(refreshJobs, 2000);
         });
         
         function setupEventListeners() {
@@ -580,6 +1392,7 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
                 fileItem.innerHTML = `
                     <div class="file-icon">${icon}</div>
                     <div class="file-name">${item.name}</div>
+                    ${item.type === 'directory' ? healthBadges(item) : ''}
                     ${item.size ? `<div class="file-size">${formatFileSize(item.size)}</div>` : ''}
                 `;
                 
@@ -601,32 +1414,33 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
             document.getElementById('revFile').value = path;
         }
         
+        function healthBadges(item) {
+            const badges = [];
+            if (item.complete) badges.push(`<span title="Set completi">✅ ${item.complete}</span>`);
+            if (item.repairable) badges.push(`<span title="Set riparabili">🔧 ${item.repairable}</span>`);
+            if (item.incomplete) badges.push(`<span title="Set incompleti">⚠️ ${item.incomplete}</span>`);
+            return badges.length ? `<div class="file-health">${badges.join(' ')}</div>` : '';
+        }
+        
         function formatFileSize(bytes) {
             if (bytes === 0) return '0 B';
-            const units = ['B', 'KB', 'MB', 'GB'];
+            const units = ['B', 'KB', 'MB', 'GB', 'TB'];
             const i = Math.floor(Math.log(bytes) / Math.log(1024));
             return `${(bytes / Math.pow(1024, i)).toFixed(1)} ${units[i]}`;
         }
         
         async function startRepair() {
             const revFile = document.getElementById('revFile').value.trim();
-            const terminal = document.getElementById('terminal');
             if (!revFile) { alert('Seleziona un file .rev prima di avviare la riparazione.'); return; }
             
             const repairBtn = document.getElementById('repairBtn');
-            const cancelBtn = document.getElementById('cancelBtn');
-            
             repairBtn.disabled = true;
-            repairBtn.innerHTML = '<div class="loading"></div>Riparando...';
-            cancelBtn.style.display = 'inline-block';
-            terminal.innerHTML = '';
-            terminal.classList.add('active');
             
             try {
                 const response = await fetch('/repair', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-                    body: 'rev_file=' + encodeURIComponent(revFile)
+                    body: 'rev_file=' + encodeURIComponent(revFile) + '&priority=' + encodeURIComponent(document.getElementById('priority').value)
                 });
 
                 if (!response.ok) {
@@ -636,48 +1450,74 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
                 const result = await response.json();
                 
                 if (result.success) {
-                    currentSessionId = result.session_id;
-                    connectToStream(result.session_id);
+                    viewJob(result.session_id, result.created ? '' : 'ℹ️ Questo set è già in coda o in riparazione: mostro il lavoro esistente.\\n\\n');
+                    refreshJobs();
                 } else {
-                    terminal.textContent = `Errore durante l'avvio: ${result.error || 'Errore sconosciuto.'}`;
-                    resetUI();
+                    showTerminalMessage(`Errore durante l'avvio: ${result.error || 'Errore sconosciuto.'}`);
                 }
             } catch (error) {
-                terminal.textContent = `Errore di connessione: ${error.message}`;
-                resetUI();
+                showTerminalMessage(`Errore di connessione: ${error.message}`);
+            } finally {
+                repairBtn.disabled = false;
             }
         }
         
+        function showTerminalMessage(text) {
+            const terminal = document.getElementById('terminal');
+            terminal.textContent = text;
+            terminal.classList.add('active');
+        }
+        
+        function viewJob(sessionId, notice = '') {
+            if (currentEventSource) currentEventSource.close();
+            showTerminalMessage(notice);
+            currentSessionId = sessionId;
+            
+            const cancelBtn = document.getElementById('cancelBtn');
+            cancelBtn.style.display = 'inline-block';
+            cancelBtn.disabled = false;
+            cancelBtn.textContent = 'Annulla Riparazione';
+            
+            connectToStream(sessionId);
+            renderJobs();
+        }
+        
         async function cancelRepair() {
             if (!currentSessionId) return;
             const cancelBtn = document.getElementById('cancelBtn');
             cancelBtn.disabled = true;
             cancelBtn.textContent = 'Annullamento...';
-            
+            await cancelJob(currentSessionId);
+        }
+        
+        async function cancelJob(sessionId) {
+            const terminal = document.getElementById('terminal');
             try {
                 const response = await fetch('/cancel', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-                    body: 'session_id=' + encodeURIComponent(currentSessionId)
+                    body: 'session_id=' + encodeURIComponent(sessionId)
                 });
                 if (!response.ok) {
                     throw new Error(`Errore dal server: ${response.status} ${response.statusText}`);
                 }
                 const result = await response.json();
-                if (!result.success) {
-                    const terminal = document.getElementById('terminal');
+                if (!result.success && sessionId === currentSessionId) {
                     terminal.textContent += `❌ Errore durante l'annullamento: ${result.error}`;
                 }
             } catch (error) {
-                const terminal = document.getElementById('terminal');
-                terminal.textContent += `❌ Errore di rete durante l'annullamento: ${error.message}`;
-                resetUI();
+                if (sessionId === currentSessionId) {
+                    terminal.textContent += `❌ Errore di rete durante l'annullamento: ${error.message}`;
+                    resetUI();
+                }
             }
+            refreshJobs();
         }
         
         function connectToStream(sessionId) {
             const terminal = document.getElementById('terminal');
             const eventSource = new EventSource(`/stream/${sessionId}`);
+            currentEventSource = eventSource;
             
             eventSource.onmessage = function(event) {
                 const data = JSON.parse(event.data);
@@ -688,6 +1528,7 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
             eventSource.addEventListener('done', function(event) {
                 eventSource.close();
                 resetUI();
+                refreshJobs();
             });
             
             eventSource.onerror = function(event) {
@@ -698,17 +1539,119 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
         }
         
         function resetUI() {
-            const repairBtn = document.getElementById('repairBtn');
             const cancelBtn = document.getElementById('cancelBtn');
 
-            repairBtn.disabled = false;
-            repairBtn.textContent = 'Ripara Archivio';
-
             cancelBtn.style.display = 'none';
             cancelBtn.disabled = false;
             cancelBtn.textContent = 'Annulla Riparazione';
             
-            currentSessionId = null;
+            currentEventSource = null;
+        }
+        
+        const JOB_STATUS_LABELS = {
+            queued: '⏳ In coda',
+            starting: '🚀 Avvio...',
+            running: '🔧 In esecuzione',
+            done: '✅ Completato',
+            failed: '❌ Fallito',
+            cancelled: '🛑 Annullato'
+        };
+        const JOB_FINISHED_STATES = ['done', 'failed', 'cancelled'];
+        
+        async function refreshJobs() {
+            try {
+                const response = await fetch('/jobs');
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const result = await response.json();
+                if (result.success) {
+                    jobs = result.jobs;
+                    renderJobs();
+                }
+            } catch (error) {
+                console.error('Impossibile aggiornare la coda lavori:', error);
+            }
+        }
+        
+        function makeJobButton(text, className, onClick) {
+            const button = document.createElement('button');
+            button.type = 'button';
+            button.className = `job-btn ${className}`;
+            button.textContent = text;
+            button.addEventListener('click', onClick);
+            return button;
+        }
+        
+        function makePrioritySelect(job) {
+            const select = document.createElement('select');
+            select.className = 'job-priority';
+            select.title = 'Priorità nella coda';
+            [['1', 'Alta'], ['0', 'Normale'], ['-1', 'Bassa']].forEach(([value, label]) => {
+                const option = document.createElement('option');
+                option.value = value;
+                option.textContent = label;
+                select.appendChild(option);
+            });
+            select.value = String(job.priority || 0);
+            select.addEventListener('change', () => setJobPriority(job.id, select.value));
+            return select;
+        }
+        
+        async function setJobPriority(sessionId, priority) {
+            try {
+                const response = await fetch('/priority', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
+                    body: 'session_id=' + encodeURIComponent(sessionId) + '&priority=' + encodeURIComponent(priority)
+                });
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const result = await response.json();
+                if (!result.success) alert(`Impossibile cambiare la priorità: ${result.error}`);
+            } catch (error) {
+                alert(`Errore di connessione: ${error.message}`);
+            }
+            refreshJobs();
+        }
+        
+        function renderJobs() {
+            const jobListEl = document.getElementById('jobList');
+            // Non ridisegna l'elenco mentre l'utente sta scegliendo una priorità.
+            if (document.activeElement && document.activeElement.classList.contains('job-priority')) return;
+            // Prima i lavori in esecuzione, poi quelli in coda nell'ordine in cui partiranno,
+            // infine gli ultimi 10 terminati.
+            const active = jobs.filter(job => !JOB_FINISHED_STATES.includes(job.status))
+                .sort((a, b) => (a.position || 0) - (b.position || 0));
+            const finished = jobs.filter(job => JOB_FINISHED_STATES.includes(job.status))
+                .sort((a, b) => b.finished - a.finished)
+                .slice(0, 10);
+            
+            jobListEl.innerHTML = '';
+            if (active.length + finished.length === 0) {
+                jobListEl.innerHTML = '<div style="padding: 15px; text-align: center; color: #666;">Nessun lavoro</div>';
+                return;
+            }
+            
+            active.concat(finished).forEach(job => {
+                const jobItem = document.createElement('div');
+                jobItem.className = 'job-item' + (job.id === currentSessionId ? ' selected' : '');
+                
+                const name = document.createElement('div');
+                name.className = 'job-name';
+                name.textContent = job.target.split('/').pop();
+                name.title = job.target;
+                
+                const status = document.createElement('div');
+                status.className = 'job-status';
+                status.textContent = (JOB_STATUS_LABELS[job.status] || job.status)
+                    + (job.status === 'queued' && job.position ? ` (posizione ${job.position})` : '');
+                
+                jobItem.append(name, status);
+                if (job.status === 'queued') jobItem.appendChild(makePrioritySelect(job));
+                jobItem.appendChild(makeJobButton('Output', '', () => viewJob(job.id)));
+                if (!JOB_FINISHED_STATES.includes(job.status)) {
+                    jobItem.appendChild(makeJobButton('Annulla', 'job-cancel', () => cancelJob(job.id)));
+                }
+                jobListEl.appendChild(jobItem);
+            });
         }
 
         function shutdownServer() {
@@ -726,24 +1669,166 @@ class RARRepairHandler(http.server.BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         pass
 
-def main():
+def serve(port=PORT, jobs_path=JOBS_PATH, stats_interval=FOLDER_STATS_INTERVAL):
+    import http.server
+    from socketserver import ThreadingTCPServer
+
+    class RARRepairHandler(RARRepairRoutes, http.server.BaseHTTPRequestHandler):
+        pass
+
     print("=== RAR Repair Tool per Synology NAS (v3) ===")
-    print(f"Avvio server su porta {PORT}...")
+    print(f"Avvio server su porta {port}...")
+    global job_manager
+    job_manager = JobManager(jobs_path)
+    if not job_manager.open():
+        print(f"❌ Errore: un altro server sta già usando la coda lavori in {jobs_path}")
+        return 1
+    print(f"✅ Coda lavori: {jobs_path}")
+    global folder_stats
+    folder_stats = FolderStatsWalker(ROOT_PATH, interval=stats_interval)
+    folder_stats.start()
     if not os.path.exists(RAR_PATH): print(f"⚠️  ATTENZIONE: RAR non trovato in {RAR_PATH}")
     else: print(f"✅ RAR trovato in {RAR_PATH}")
     if not os.path.exists(ROOT_PATH): print(f"⚠️  ATTENZIONE: {ROOT_PATH} non trovato")
     else: print(f"✅ Directory root: {ROOT_PATH}")
     try:
-        with ThreadingTCPServer(("", PORT), RARRepairHandler) as httpd:
+        with ThreadingTCPServer(("", port), RARRepairHandler) as httpd:
             print(f"✅ Server avviato con successo!")
-            print(f"🌐 Accedi a: http://localhost:{PORT} o http://[IP-DEL-NAS]:{PORT}")
+            print(f"🌐 Accedi a: http://localhost:{port} o http://[IP-DEL-NAS]:{port}")
             print("💡 Premi il pulsante 🛑 nell'interfaccia web per fermare il server.")
             print("-" * 50)
             httpd.serve_forever()
             print("\n🛑 Server fermato tramite interfaccia web.")
     except KeyboardInterrupt: print("\n🛑 Server fermato dall'utente (Ctrl+C)")
-    except PermissionError: print(f"❌ Errore: Porta {PORT} non disponibile. Un altro servizio la sta usando?")
-    except Exception as e: print(f"❌ Errore imprevisto: {e}")
+    except PermissionError: print(f"❌ Errore: Porta {port} non disponibile. Un altro servizio la sta usando?"); return 1
+    except Exception as e: print(f"❌ Errore imprevisto: {e}"); return 1
+    return 0
+
+class JsonLinesWriter:
+    """Scrive eventi JSON, uno per riga, su stdout; sicuro tra thread diversi."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({"event": event, **fields}, ensure_ascii=False)
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+class JsonLinesOutput:
+    """Adatta l'output di run_rar_action (metodo `put`) a eventi JSON-lines per un singolo target."""
+
+    def __init__(self, writer, target):
+        self.writer = writer
+        self.target = target
+
+    def put(self, text):
+        if text == "__DONE__":
+            return
+        self.writer.emit("output", target=self.target, text=text)
+
+def resolve_targets(action, targets):
+    # Le cartelle vengono espanse nei set RAR che contengono: per "repair" il primo file .rev
+    # di ogni set, per "verify" il primo volume. I file vengono passati così come sono.
+    # Restituisce un dizionario {file: costo stimato}; ogni cartella viene letta una volta sola.
+    resolved = {}
+    listings = {}
+    for target in targets:
+        target = os.path.abspath(target)
+        if not os.path.isdir(target):
+            dirpath = os.path.dirname(target)
+            if dirpath not in listings:
+                listings[dirpath] = list_files(dirpath)
+            resolved.setdefault(target, estimate_rar_cost(action, target, listings[dirpath]))
+            continue
+        for rar_set in find_rar_sets(target):
+            files = rar_set["rev_files"] if action == "repair" else rar_set["volumes"]
+            if files:
+                resolved.setdefault(files[0], rar_set_cost(action, rar_set))
+    return resolved
+
+def run_cli_action(action, targets, jobs, writer, jobs_path=JOBS_PATH):
+    from concurrent.futures import ThreadPoolExecutor
+    
+    # I set già in coda nel server web o su cui sta lavorando un altro `rar` vengono saltati.
+    busy = running_rar_sets() | {
+        rar_set_key(job['target']) for job in load_jobs(jobs_path) if job['status'] not in JOB_FINISHED_STATES
+    }
+
+    def run_one(target):
+        writer.emit("start", action=action, target=target)
+        started = time.monotonic()
+        return_code = run_rar_action(action, target, JsonLinesOutput(writer, target))
+        success = return_code == 0
+        writer.emit("result", action=action, target=target, success=success,
+                    returncode=return_code, elapsed=round(time.monotonic() - started, 3))
+        return success
+
+    resolved = resolve_targets(action, targets)
+    targets = sorted(resolved, key=resolved.get)
+    skipped = [target for target in targets if rar_set_key(target) in busy]
+    for target in skipped:
+        writer.emit("skipped", action=action, target=target, reason="Set già in coda o in elaborazione")
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = list(executor.map(run_one, [target for target in targets if target not in skipped]))
+    succeeded = sum(results)
+    writer.emit("summary", action=action, total=len(results), succeeded=succeeded,
+                failed=len(results) - succeeded, skipped=len(skipped))
+    return 0 if succeeded == len(results) else 1
+
+def run_cli_scan(targets, writer):
+    exit_code = 0
+    for target in targets:
+        target = os.path.abspath(target)
+        if not os.path.isdir(target):
+            error = "Cartella non trovata" if not os.path.exists(target) else "Il percorso non è una cartella"
+            writer.emit("error", target=target, error=error)
+            exit_code = 1
+            continue
+        for rar_set in find_rar_sets(target):
+            writer.emit("set", **rar_set)
+    return exit_code
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Ripara archivi RAR con file .rev tramite interfaccia web o da riga di comando."
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="avvia il server web (predefinito)")
+    serve_parser.add_argument("--port", type=int, default=PORT, help=f"porta del server (predefinita: {PORT})")
+    serve_parser.add_argument("--jobs-dir", default=JOBS_PATH,
+                              help=f"cartella della coda lavori (predefinita: {JOBS_PATH})")
+    serve_parser.add_argument("--stats-interval", type=int, default=FOLDER_STATS_INTERVAL,
+                              help="secondi tra due scansioni complete delle cartelle; 0 = solo all'avvio "
+                                   f"(predefinito: {FOLDER_STATS_INTERVAL})")
+
+    for action, help_text in (("repair", "ricostruisce i volumi mancanti con `rar rc`"),
+                              ("verify", "verifica gli archivi con `rar t`")):
+        action_parser = subparsers.add_parser(action, help=help_text)
+        action_parser.add_argument("targets", nargs="+", metavar="PERCORSO",
+                                   help="file o cartelle (le cartelle vengono scansionate alla ricerca di set RAR)")
+        action_parser.add_argument("-j", "--jobs", type=int, default=2,
+                                   help="numero di operazioni in parallelo (predefinito: 2)")
+        action_parser.add_argument("--jobs-dir", default=JOBS_PATH,
+                                   help="cartella della coda lavori del server, per non elaborare gli stessi set")
+
+    scan_parser = subparsers.add_parser("scan", help="elenca i set RAR trovati nelle cartelle indicate")
+    scan_parser.add_argument("targets", nargs="+", metavar="CARTELLA")
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command in (None, "serve"):
+        return serve(getattr(args, "port", PORT), getattr(args, "jobs_dir", JOBS_PATH),
+                     getattr(args, "stats_interval", FOLDER_STATS_INTERVAL))
+    writer = JsonLinesWriter()
+    if args.command == "scan":
+        return run_cli_scan(args.targets, writer)
+    return run_cli_action(args.command, args.targets, args.jobs, writer, args.jobs_dir)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())